@@ -1,7 +1,8 @@
 import os
 import pytest
 import tempfile
-from typing import Tuple, Optional
+import threading
+from typing import List, Tuple, Optional
 
 import bitcoinx
 
@@ -31,6 +32,25 @@ tx_hex_2 = ("010000000113529b6e34ceebfa3911c569b568ef48b95cc25d4c5c6a5b2435d30c9
     "87b1812206fd4efc9ada388acc0dd3e00000000001976a914337106761eb441a326d4027f6d5aa19eed550c298"+
     "8ac00000000")
 
+TX_BYTES_1 = bytes.fromhex(tx_hex_1)
+TX_HASH_1 = bitcoinx.double_sha256(TX_BYTES_1)
+TX_BYTES_2 = bytes.fromhex(tx_hex_2)
+TX_HASH_2 = bitcoinx.double_sha256(TX_BYTES_2)
+
+
+def _create_settled_rows(store: wallet_database.TransactionTable,
+        sizes: List[int]) -> List[Tuple[bytes, TxData, bytes, TxFlags, None]]:
+    # Random bytedata of each given size, written to the store as settled transactions.
+    rows = []
+    for size in sizes:
+        bytedata = os.urandom(size)
+        metadata = TxData(height=1, fee=2, position=None, date_added=1, date_updated=1)
+        rows.append((bitcoinx.double_sha256(bytedata), metadata, bytedata,
+            TxFlags.StateSettled, None))
+    with SynchronousWriter() as writer:
+        store.create(rows, completion_callback=writer.get_callback())
+        assert writer.succeeded()
+    return rows
 
 
 class TestWalletDataTable:
@@ -57,8 +77,8 @@ class TestWalletDataTable:
         self.store._get_current_timestamp = self._get_timestamp
         self._timestamp = 1
         db = self.store._db
-        db.execute(f"DELETE FROM WalletData")
-        db.commit()
+        # The connection is in autocommit mode, so this takes effect without an explicit commit.
+        db.execute("DELETE FROM WalletData")
 
     def _get_timestamp(self) -> int:
         return self._timestamp
@@ -90,8 +110,10 @@ class TestWalletDataTable:
 
         kvs2 = self.store.read([ k for (k, v) in kvs ])
         assert len(kvs) == len(kvs2)
+        # The values are not hashable, so the rows are matched up by their unique keys.
+        kvs2_by_key = { t.key: t for t in kvs2 }
         for t in kvs:
-            assert t in kvs2
+            assert t == kvs2_by_key[t.key]
 
     @pytest.mark.timeout(5)
     def test_update(self) -> None:
@@ -116,7 +138,7 @@ class TestWalletDataTable:
         rows = self.store.read()
         assert len(rows) == len(new_values)
         for row in rows:
-            assert row in entries
+            assert row == WalletDataRow(row.key, new_values[row.key])
 
     def test_get_value_nonexistent(self) -> None:
         assert self.store.get_value("nonexistent") is None
@@ -195,12 +217,15 @@ class TestTransactionCache:
 
     def setup_method(self):
         db = self.store._db
-        db.execute(f"DELETE FROM Transactions")
-        db.commit()
+        # The connection is in autocommit mode, so this takes effect without an explicit commit.
+        db.execute("DELETE FROM Transactions")
 
-    def test_entry_visible(self):
-        cache = TransactionCache(self.store)
+    @pytest.fixture
+    def cache(self) -> TransactionCache:
+        # The tables are emptied in `setup_method`, which is applied before this fixture.
+        return TransactionCache(self.store)
 
+    def test_entry_visible(self, cache: TransactionCache):
         combos = [
             (TxFlags.Unset, None, None, True),
             (TxFlags.Unset, None, TxFlags.HasHeight, False),
@@ -214,40 +239,51 @@ class TestTransactionCache:
             actual_result = cache._entry_visible(flag_bits, flags, mask)
             assert result == actual_result, str(combos[i])
 
-    @pytest.mark.timeout(5)
-    def test_add_missing_transaction(self):
-        cache = TransactionCache(self.store)
-
-        tx_bytes_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(tx_bytes_1)
+    def test_entry_visible_all_combinations(self, cache: TransactionCache) -> None:
+        # The expected results for an entry with the fee and height bits set, worked out by hand
+        # from the rules in the `_entry_visible` docstring. Each row is a flags value, and each
+        # column is a mask value.
+        flag_bits = TxFlags.HasFee | TxFlags.HasHeight
+        values = [ None, TxFlags.Unset, TxFlags.HasFee, TxFlags.HasHeight,
+            TxFlags.HasFee | TxFlags.HasHeight, TxFlags.HasByteData ]
+        expected_results = [
+            # mask: None   Unset  Fee    Height Both   ByteData
+            [       True,  False, True,  True,  True,  False ], # flags: None
+            [       False, True,  False, False, False, True  ], # flags: Unset
+            [       True,  False, True,  False, False, False ], # flags: Fee
+            [       True,  False, False, True,  False, False ], # flags: Height
+            [       True,  False, False, False, True,  False ], # flags: Both
+            [       False, False, False, False, False, False ], # flags: ByteData
+        ]
+        for flags, row in zip(values, expected_results):
+            for mask, result in zip(values, row):
+                assert result == cache._entry_visible(flag_bits, flags, mask), \
+                    (TxFlags.to_repr(flags), TxFlags.to_repr(mask))
 
+    @pytest.mark.timeout(5)
+    def test_add_missing_transaction(self, cache: TransactionCache):
         with SynchronousWriter() as writer:
-            cache.add_missing_transaction(tx_hash_1, 100, 94,
+            cache.add_missing_transaction(TX_HASH_1, 100, 94,
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert cache.is_cached(tx_hash_1)
-        entry = cache.get_entry(tx_hash_1)
+        assert cache.is_cached(TX_HASH_1)
+        entry = cache.get_entry(TX_HASH_1)
         assert TxFlags.HasFee | TxFlags.HasHeight, entry.flags & TxFlags.METADATA_FIELD_MASK
         assert entry.bytedata is None
 
-        tx_bytes_2 = bytes.fromhex(tx_hex_2)
-        tx_hash_2 = bitcoinx.double_sha256(tx_bytes_2)
-
         with SynchronousWriter() as writer:
-            cache.add_missing_transaction(tx_hash_2, 200,
+            cache.add_missing_transaction(TX_HASH_2, 200,
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert cache.is_cached(tx_hash_2)
-        entry = cache.get_entry(tx_hash_2)
+        assert cache.is_cached(TX_HASH_2)
+        entry = cache.get_entry(TX_HASH_2)
         assert TxFlags.HasHeight == entry.flags & TxFlags.METADATA_FIELD_MASK
         assert entry.bytedata is None
 
     @pytest.mark.timeout(5)
-    def test_add_transaction(self):
-        cache = TransactionCache(self.store)
-
+    def test_add_transaction(self, cache: TransactionCache):
         tx = Transaction.from_hex(tx_hex_1)
         with SynchronousWriter() as writer:
             cache.add_transaction(tx, completion_callback=writer.get_callback())
@@ -259,9 +295,7 @@ class TestTransactionCache:
         assert entry.bytedata is not None
 
     @pytest.mark.timeout(5)
-    def test_add_transaction_update(self):
-        cache = TransactionCache(self.store)
-
+    def test_add_transaction_update(self, cache: TransactionCache):
         tx = Transaction.from_hex(tx_hex_1)
         data = [ tx.hash(), TxData(height=1295924,position=4,fee=None, date_added=1,
             date_updated=1), None, TxFlags.Unset ]
@@ -284,50 +318,42 @@ class TestTransactionCache:
         assert TxFlags.StateCleared == entry.flags & TxFlags.StateCleared
 
     @pytest.mark.timeout(5)
-    def test_add_then_update(self):
-        cache = TransactionCache(self.store)
-
-        bytedata_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(bytedata_1)
+    def test_add_then_update(self, cache: TransactionCache):
         metadata_1 = TxData(position=11)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, metadata_1, bytedata_1, TxFlags.StateDispatched) ],
+            cache.add([ (TX_HASH_1, metadata_1, TX_BYTES_1, TxFlags.StateDispatched) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert cache.is_cached(tx_hash_1)
-        entry = cache.get_entry(tx_hash_1)
+        assert cache.is_cached(TX_HASH_1)
+        entry = cache.get_entry(TX_HASH_1)
         assert TxFlags.HasByteData | TxFlags.HasPosition | TxFlags.StateDispatched == entry.flags
         assert entry.bytedata is not None
 
         metadata_2 = TxData(fee=10, height=88)
         propagate_flags = TxFlags.HasFee | TxFlags.HasHeight
         with SynchronousWriter() as writer:
-            cache.update([ (tx_hash_1, metadata_2, None, propagate_flags | TxFlags.HasPosition) ],
+            cache.update([ (TX_HASH_1, metadata_2, None, propagate_flags | TxFlags.HasPosition) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        entry = cache.get_entry(tx_hash_1)
+        entry = cache.get_entry(TX_HASH_1)
         expected_flags = propagate_flags | TxFlags.StateDispatched | TxFlags.HasByteData
         assert expected_flags == entry.flags, \
             f"{TxFlags.to_repr(expected_flags)} !=  {TxFlags.to_repr(entry.flags)}"
         assert entry.bytedata is not None
 
     @pytest.mark.timeout(5)
-    def test_update_or_add(self):
-        cache = TransactionCache(self.store)
-
+    def test_update_or_add(self, cache: TransactionCache):
         # Add.
-        bytedata_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(bytedata_1)
         metadata_1 = TxData()
         with SynchronousWriter() as writer:
-            cache.update_or_add([ (tx_hash_1, metadata_1, bytedata_1, TxFlags.StateSettled) ],
+            cache.update_or_add([ (TX_HASH_1, metadata_1, TX_BYTES_1, TxFlags.StateSettled) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert cache.is_cached(tx_hash_1)
-        entry = cache.get_entry(tx_hash_1)
+        assert cache.is_cached(TX_HASH_1)
+        entry = cache.get_entry(TX_HASH_1)
         assert TxFlags.HasByteData | TxFlags.StateSettled == entry.flags
         assert entry.bytedata is not None
 
@@ -335,82 +361,70 @@ class TestTransactionCache:
         metadata_2 = TxData(position=22)
         with SynchronousWriter() as writer:
             updated_ids = cache.update_or_add([
-                (tx_hash_1, metadata_2, None, TxFlags.HasPosition | TxFlags.StateDispatched) ],
+                (TX_HASH_1, metadata_2, None, TxFlags.HasPosition | TxFlags.StateDispatched) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        entry = cache.get_entry(tx_hash_1)
-        _tx_hash, store_flags, _metadata = self.store.read_metadata(tx_hashes=[ tx_hash_1 ])[0]
+        entry = cache.get_entry(TX_HASH_1)
+        _tx_hash, store_flags, _metadata = self.store.read_metadata(tx_hashes=[ TX_HASH_1 ])[0]
         # State flags if present get set in an update otherwise they remain the same.
         expected_flags = TxFlags.HasPosition | TxFlags.HasByteData | TxFlags.StateDispatched
         assert expected_flags == store_flags, \
             f"{TxFlags.to_repr(expected_flags)} !=  {TxFlags.to_repr(store_flags)}"
         assert expected_flags == entry.flags, \
             f"{TxFlags.to_repr(expected_flags)} !=  {TxFlags.to_repr(entry.flags)}"
-        assert bytedata_1 == entry.bytedata
+        assert TX_BYTES_1 == entry.bytedata
         assert metadata_2.position == entry.metadata.position
-        assert updated_ids == set([ tx_hash_1 ])
+        assert updated_ids == set([ TX_HASH_1 ])
 
     @pytest.mark.timeout(5)
-    def test_delete(self):
-        cache = TransactionCache(self.store)
-
-        tx_bytes_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(tx_bytes_1)
+    def test_delete(self, cache: TransactionCache):
         data = TxData(position=11)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, data, tx_bytes_1, TxFlags.StateDispatched) ],
+            cache.add([ (TX_HASH_1, data, TX_BYTES_1, TxFlags.StateDispatched) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert len(self.store.read_metadata(tx_hashes=[ tx_hash_1 ]))
-        assert cache.is_cached(tx_hash_1)
+        assert len(self.store.read_metadata(tx_hashes=[ TX_HASH_1 ]))
+        assert cache.is_cached(TX_HASH_1)
 
         with SynchronousWriter() as writer:
-            cache.delete(tx_hash_1, completion_callback=writer.get_callback())
+            cache.delete(TX_HASH_1, completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert not len(self.store.read_metadata(tx_hashes=[ tx_hash_1 ]))
-        assert not cache.is_cached(tx_hash_1)
+        assert not len(self.store.read_metadata(tx_hashes=[ TX_HASH_1 ]))
+        assert not cache.is_cached(TX_HASH_1)
 
     @pytest.mark.timeout(5)
-    def test_uncleared_bytedata_requirements(self) -> None:
-        cache = TransactionCache(self.store)
-
-        tx_bytes_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(tx_bytes_1)
+    @pytest.mark.parametrize("state_flag", TRANSACTION_FLAGS, ids=TxFlags.to_repr)
+    def test_uncleared_bytedata_requirements(self, cache: TransactionCache,
+            state_flag: TxFlags) -> None:
         data = TxData(position=11)
-        for state_flag in TRANSACTION_FLAGS:
-            with pytest.raises(wallet_database.InvalidDataError):
-                cache.add([ (tx_hash_1, data, None, state_flag) ])
+        with pytest.raises(wallet_database.InvalidDataError):
+            cache.add([ (TX_HASH_1, data, None, state_flag) ])
 
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, data, tx_bytes_1, TxFlags.StateSigned) ],
+            cache.add([ (TX_HASH_1, data, TX_BYTES_1, TxFlags.StateSigned) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
         # We are applying a clearing of the bytedata, this should be invalid given uncleared.
-        for state_flag in TRANSACTION_FLAGS:
-            with pytest.raises(wallet_database.InvalidDataError):
-                cache.update([ (tx_hash_1, data, None, state_flag | TxFlags.HasByteData) ])
+        with pytest.raises(wallet_database.InvalidDataError):
+            cache.update([ (TX_HASH_1, data, None, state_flag | TxFlags.HasByteData) ])
 
     @pytest.mark.timeout(5)
-    def test_get_flags(self):
-        cache = TransactionCache(self.store)
-
+    def test_get_flags(self, cache: TransactionCache):
         assert cache.get_flags(os.urandom(10).hex()) is None
 
-        tx_bytes_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(tx_bytes_1)
         data = TxData(position=11)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, data, tx_bytes_1, TxFlags.StateDispatched) ],
+            cache.add([ (TX_HASH_1, data, TX_BYTES_1, TxFlags.StateDispatched) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert cache.is_cached(tx_hash_1)
+        assert cache.is_cached(TX_HASH_1)
         assert TxFlags.StateDispatched | TxFlags.HasByteData | TxFlags.HasPosition == \
-            cache.get_flags(tx_hash_1)
+            cache.get_flags(TX_HASH_1)
 
     @pytest.mark.timeout(5)
     def test_get_metadata(self):
@@ -473,34 +487,113 @@ class TestTransactionCache:
 
         cached_entry_2 = cache.get_cached_entry(tx_hash)
         assert entry == cached_entry_2
+        assert len(bytedata_set) == cache._bytedata_cache_bytes
+
+    @pytest.mark.timeout(5)
+    def test_bytedata_cache_size(self) -> None:
+        # Settled bytedata loaded from the store should be evicted to stay within the budget.
+        rows = _create_settled_rows(self.store, [ 10, 10, 10 ])
+
+        cache = TransactionCache(self.store, bytedata_cache_size=25)
+        for tx_hash, _metadata, bytedata, _flags, _description in rows:
+            entry = cache.get_entry(tx_hash)
+            assert entry.bytedata == bytedata
+            assert cache._bytedata_cache_bytes <= 25
+
+        assert 20 == cache._bytedata_cache_bytes
+        evicted_hashes = [ row[0] for row in rows
+            if not cache.get_cached_entry(row[0]).is_bytedata_cached() ]
+        assert 1 == len(evicted_hashes)
+
+        # An evicted entry still has its metadata cached, and reloads its bytedata on demand.
+        entry = cache.get_cached_entry(evicted_hashes[0])
+        assert entry.is_metadata_cached()
+        assert entry.bytedata is None
+        entry = cache.get_entry(evicted_hashes[0])
+        assert entry.bytedata is not None
+        assert cache._bytedata_cache_bytes <= 25
+
+    @pytest.mark.timeout(5)
+    def test_bytedata_cache_modified_entries(self) -> None:
+        # Entries modified in place must remain the cached entries until their store write
+        # completes. The first two are each over the budget by themselves, the rest cause
+        # evictions.
+        rows = _create_settled_rows(self.store, [ 30, 30, 10, 10, 10 ])
+        cache = TransactionCache(self.store, bytedata_cache_size=25)
+        tx_hash_a, tx_hash_b = rows[0][0], rows[1][0]
+
+        # Hold the writer so that the modifications stay pending.
+        gate = threading.Event()
+        self.db_context.queue_write(lambda conn: gate.wait(5))
+
+        with SynchronousWriter() as writer_a, SynchronousWriter() as writer_b:
+            flags = cache.update_flags(tx_hash_a, TxFlags.StateCleared | TxFlags.HasByteData,
+                TxFlags.HasByteData, completion_callback=writer_a.get_callback())
+            entry_a = cache.get_cached_entry(tx_hash_a)
+            assert flags == entry_a.flags
+            assert TxFlags.StateCleared == entry_a.flags & TxFlags.STATE_MASK
+            assert rows[0][2] == entry_a.bytedata
+
+            proof = TxProof(position=10, branch=[ os.urandom(32) for i in range(10) ])
+            cache.update_proof(tx_hash_b, proof, completion_callback=writer_b.get_callback())
+            entry_b = cache.get_cached_entry(tx_hash_b)
+            assert 1 < entry_b.metadata.date_updated
+            assert rows[1][2] == entry_b.bytedata
+
+            # Loading the remaining bytedata evicts, but never the modified entries.
+            for tx_hash, _metadata, bytedata, _flags, _description in rows[2:]:
+                assert bytedata == cache.get_entry(tx_hash).bytedata
+                assert cache._bytedata_cache_bytes <= 25
+            assert entry_a is cache.get_cached_entry(tx_hash_a)
+            assert entry_b is cache.get_cached_entry(tx_hash_b)
+
+            gate.set()
+            assert writer_a.succeeded()
+            assert writer_b.succeeded()
+
+        # Once written, the modified entries are evictable again and keep their changes.
+        assert flags == cache.get_cached_entry(tx_hash_a).flags
+        assert entry_b.metadata == cache.get_cached_entry(tx_hash_b).metadata
+        assert {} == cache._bytedata_pending_writes
+
+    @pytest.mark.timeout(5)
+    def test_bytedata_cache_size_after_updates(self) -> None:
+        # Entries modified in place count against the budget again once written.
+        rows = _create_settled_rows(self.store, [ 10 ] * 10)
+        cache = TransactionCache(self.store, bytedata_cache_size=25)
+        for tx_hash, _metadata, _bytedata, _flags, _description in rows:
+            with SynchronousWriter() as writer:
+                cache.update_flags(tx_hash, TxFlags.StateSettled | TxFlags.HasByteData,
+                    TxFlags.HasByteData, completion_callback=writer.get_callback())
+                assert writer.succeeded()
+
+        held_bytes = sum(len(entry.bytedata) for entry in cache._cache.values()
+            if entry.bytedata is not None)
+        assert held_bytes == cache._bytedata_cache_bytes
+        assert cache._bytedata_cache_bytes <= 25
 
     @pytest.mark.timeout(5)
     def test_get_transaction(self):
-        bytedata = bytes.fromhex(tx_hex_1)
-        tx_hash = bitcoinx.double_sha256(bytedata)
         metadata = TxData(height=1, fee=2, position=None, date_added=1, date_updated=1)
         with SynchronousWriter() as writer:
-            self.store.create([ (tx_hash, metadata, bytedata, TxFlags.Unset, None) ],
+            self.store.create([ (TX_HASH_1, metadata, TX_BYTES_1, TxFlags.Unset, None) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
         cache = TransactionCache(self.store)
-        tx = cache.get_transaction(tx_hash)
+        tx = cache.get_transaction(TX_HASH_1)
         assert tx is not None
-        assert tx_hash == tx.hash()
+        assert TX_HASH_1 == tx.hash()
 
     @pytest.mark.timeout(5)
     def test_get_transactions(self):
-        tx_hashes = []
-        for tx_hex in (tx_hex_1, tx_hex_2):
-            tx_bytes = bytes.fromhex(tx_hex)
-            tx_hash = bitcoinx.double_sha256(tx_bytes)
-            data = TxData(height=1, fee=2, position=None, date_added=1, date_updated=1)
-            with SynchronousWriter() as writer:
-                self.store.create([ (tx_hash, data, tx_bytes, TxFlags.Unset, None) ],
-                    completion_callback=writer.get_callback())
-                assert writer.succeeded()
-            tx_hashes.append(tx_hash)
+        data = TxData(height=1, fee=2, position=None, date_added=1, date_updated=1)
+        rows = [ (tx_hash, data, tx_bytes, TxFlags.Unset, None)
+            for (tx_bytes, tx_hash) in ((TX_BYTES_1, TX_HASH_1), (TX_BYTES_2, TX_HASH_2)) ]
+        with SynchronousWriter() as writer:
+            self.store.create(rows, completion_callback=writer.get_callback())
+            assert writer.succeeded()
+        tx_hashes = [ row[0] for row in rows ]
 
         cache = TransactionCache(self.store)
         for (tx_hash, tx) in cache.get_transactions(tx_hashes=tx_hashes):
@@ -508,21 +601,17 @@ class TestTransactionCache:
             assert tx_hash in  tx_hashes
 
     @pytest.mark.timeout(5)
-    def test_get_entry(self):
-        cache = TransactionCache(self.store)
-
-        bytedata_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(bytedata_1)
+    def test_get_entry(self, cache: TransactionCache):
         data = TxData(position=11)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, data, bytedata_1, TxFlags.StateSettled) ],
+            cache.add([ (TX_HASH_1, data, TX_BYTES_1, TxFlags.StateSettled) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        entry = cache.get_entry(tx_hash_1, TxFlags.StateDispatched)
+        entry = cache.get_entry(TX_HASH_1, TxFlags.StateDispatched)
         assert entry is None
 
-        entry = cache.get_entry(tx_hash_1, TxFlags.StateSettled)
+        entry = cache.get_entry(TX_HASH_1, TxFlags.StateSettled)
         assert entry is not None
 
     # No complete cache of metadata, tx_hash in cache, store not hit.
@@ -569,34 +658,26 @@ class TestTransactionCache:
         assert their_entry.flags == flags
 
     @pytest.mark.timeout(5)
-    def test_get_height(self):
-        cache = TransactionCache(self.store)
-
-        bytedata_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(bytedata_1)
+    def test_get_height(self, cache: TransactionCache):
         metadata_1 = TxData(height=11)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, metadata_1, bytedata_1, TxFlags.StateSettled) ],
+            cache.add([ (TX_HASH_1, metadata_1, TX_BYTES_1, TxFlags.StateSettled) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
-        assert 11 == cache.get_height(tx_hash_1)
+        assert 11 == cache.get_height(TX_HASH_1)
 
-        cache.update_flags(tx_hash_1, TxFlags.StateCleared, TxFlags.HasByteData)
-        assert 11 == cache.get_height(tx_hash_1)
+        cache.update_flags(TX_HASH_1, TxFlags.StateCleared, TxFlags.HasByteData)
+        assert 11 == cache.get_height(TX_HASH_1)
 
-        cache.update_flags(tx_hash_1, TxFlags.StateReceived, TxFlags.HasByteData)
-        assert cache.get_height(tx_hash_1) is None
+        cache.update_flags(TX_HASH_1, TxFlags.StateReceived, TxFlags.HasByteData)
+        assert cache.get_height(TX_HASH_1) is None
 
     @pytest.mark.timeout(5)
-    def test_get_unsynced_hashes(self):
-        cache = TransactionCache(self.store)
-
-        bytedata_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(bytedata_1)
+    def test_get_unsynced_hashes(self, cache: TransactionCache):
         metadata_1 = TxData(height=11)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, metadata_1, None, TxFlags.Unset) ],
+            cache.add([ (TX_HASH_1, metadata_1, None, TxFlags.Unset) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
@@ -605,36 +686,27 @@ class TestTransactionCache:
 
         metadata_2 = TxData()
         with SynchronousWriter() as writer:
-            cache.update([ (tx_hash_1, metadata_2, bytedata_1, TxFlags.HasByteData) ],
+            cache.update([ (TX_HASH_1, metadata_2, TX_BYTES_1, TxFlags.HasByteData) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
         results = cache.get_unsynced_hashes()
         assert 0 == len(results)
 
-    def test_get_unverified_entries_too_high(self):
-        cache = TransactionCache(self.store)
-
-        tx_bytes_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(tx_bytes_1)
+    def test_get_unverified_entries_too_high(self, cache: TransactionCache):
         data = TxData(height=11, position=22, date_added=1, date_updated=1)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, data, tx_bytes_1, TxFlags.StateSettled) ],
+            cache.add([ (TX_HASH_1, data, TX_BYTES_1, TxFlags.StateSettled) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
         results = cache.get_unverified_entries(100)
         assert 0 == len(results)
 
-    def test_get_unverified_entries(self) -> None:
-        cache = TransactionCache(self.store)
-
-        tx_bytes_1 = bytes.fromhex(tx_hex_1)
-        tx_hash_1 = bitcoinx.double_sha256(tx_bytes_1)
-
+    def test_get_unverified_entries(self, cache: TransactionCache) -> None:
         data = TxData(height=11, date_added=1, date_updated=1)
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_1, data, tx_bytes_1, TxFlags.StateSettled) ],
+            cache.add([ (TX_HASH_1, data, TX_BYTES_1, TxFlags.StateSettled) ],
                 completion_callback=writer.get_callback())
             assert writer.succeeded()
 
@@ -645,48 +717,35 @@ class TestTransactionCache:
         assert 1 == len(results)
 
     @pytest.mark.timeout(5)
-    def test_apply_reorg(self) -> None:
+    def test_apply_reorg(self, cache: TransactionCache) -> None:
         common_height = 5
-        cache = TransactionCache(self.store)
-
         # Add the transaction that should be reset back to settled, with data fields cleared.
-        tx_bytes_y1 = bytes.fromhex(tx_hex_1) + b"y1"
+        tx_bytes_y1 = TX_BYTES_1 + b"y1"
         tx_hash_y1 = bitcoinx.double_sha256(tx_bytes_y1)
-
         data_y1 = TxData(height=common_height+1, position=33, fee=44, date_added=1, date_updated=1)
-        with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_y1, data_y1, tx_bytes_y1, TxFlags.StateSettled) ],
-                completion_callback=writer.get_callback())
-            assert writer.succeeded()
 
         # Add the transaction that would be reset but is below the common height.
-        tx_bytes_n1 = bytes.fromhex(tx_hex_1) + b"n1"
+        tx_bytes_n1 = TX_BYTES_1 + b"n1"
         tx_hash_n1 = bitcoinx.double_sha256(tx_bytes_n1)
-
         data_n1 = TxData(height=common_height-1, position=33, fee=44, date_added=1, date_updated=1)
-        with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_n1, data_n1, tx_bytes_n1, TxFlags.StateSettled) ],
-                completion_callback=writer.get_callback())
-            assert writer.succeeded()
 
         # Add the transaction that would be reset but is the common height.
-        tx_bytes_n2 = bytes.fromhex(tx_hex_1) + b"n2"
+        tx_bytes_n2 = TX_BYTES_1 + b"n2"
         tx_hash_n2 = bitcoinx.double_sha256(tx_bytes_n2)
-
         data_n2 = TxData(height=common_height, position=33, fee=44, date_added=1, date_updated=1)
-        with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_n2, data_n2, tx_bytes_n2, TxFlags.StateSettled) ],
-                completion_callback=writer.get_callback())
-            assert writer.succeeded()
 
         # Add a canary transaction that should remain untouched due to non-cleared state.
-        tx_bytes_n3 = bytes.fromhex(tx_hex_2)
-        tx_hash_n3 = bitcoinx.double_sha256(tx_bytes_n3)
-
+        tx_bytes_n3 = TX_BYTES_2
+        tx_hash_n3 = TX_HASH_2
         data_n3 = TxData(height=111, position=333, fee=444, date_added=1, date_updated=1)
+
         with SynchronousWriter() as writer:
-            cache.add([ (tx_hash_n3, data_n3, tx_bytes_n3, TxFlags.StateDispatched) ],
-                completion_callback=writer.get_callback())
+            cache.add([
+                    (tx_hash_y1, data_y1, tx_bytes_y1, TxFlags.StateSettled),
+                    (tx_hash_n1, data_n1, tx_bytes_n1, TxFlags.StateSettled),
+                    (tx_hash_n2, data_n2, tx_bytes_n2, TxFlags.StateSettled),
+                    (tx_hash_n3, data_n3, tx_bytes_n3, TxFlags.StateDispatched),
+                ], completion_callback=writer.get_callback())
             assert writer.succeeded()
 
         # Delete as if a reorg happened above the suitable but excluded canary transaction.
@@ -696,71 +755,82 @@ class TestTransactionCache:
 
         metadata_entries = cache.get_entries(TxFlags.HasByteData, TxFlags.HasByteData)
         assert 4 == len(metadata_entries)
+        entries_by_hash = dict(metadata_entries)
 
         # Affected, canary above common height.
-        y1 = [ m[1] for m in metadata_entries if m[0] == tx_hash_y1 ][0]
-        assert 0 == y1.metadata.height
-        assert None is y1.metadata.position
-        assert data_y1.fee == y1.metadata.fee
-        assert TxFlags.StateCleared | TxFlags.HasByteData | TxFlags.HasFee == y1.flags, \
+        y1 = entries_by_hash[tx_hash_y1]
+        expected_cleared_flags = TxFlags.StateCleared | TxFlags.HasByteData | TxFlags.HasFee
+        assert (0, None, data_y1.fee, expected_cleared_flags) == \
+            (y1.metadata.height, y1.metadata.position, y1.metadata.fee, y1.flags), \
             TxFlags.to_repr(y1.flags)
 
         expected_flags = (TxFlags.HasByteData | TxFlags.HasFee |
             TxFlags.HasHeight | TxFlags.HasPosition)
+        expected_settled_flags = TxFlags.StateSettled | expected_flags
 
         # Skipped, old enough to survive.
-        n1 = [ m[1] for m in metadata_entries if m[0] == tx_hash_n1 ][0]
-        assert data_n1.height == n1.metadata.height
-        assert data_n1.position == n1.metadata.position
-        assert data_n1.fee == n1.metadata.fee
-        assert TxFlags.StateSettled | expected_flags == n1.flags, TxFlags.to_repr(n1.flags)
+        n1 = entries_by_hash[tx_hash_n1]
+        assert (data_n1.height, data_n1.position, data_n1.fee, expected_settled_flags) == \
+            (n1.metadata.height, n1.metadata.position, n1.metadata.fee, n1.flags), \
+            TxFlags.to_repr(n1.flags)
 
         # Skipped, canary common height.
-        n2 = [ m[1] for m in metadata_entries if m[0] == tx_hash_n2 ][0]
-        assert data_n2.height == n2.metadata.height
-        assert data_n2.position == n2.metadata.position
-        assert data_n2.fee == n2.metadata.fee
-        assert TxFlags.StateSettled | expected_flags == n2.flags, TxFlags.to_repr(n2.flags)
+        n2 = entries_by_hash[tx_hash_n2]
+        assert (data_n2.height, data_n2.position, data_n2.fee, expected_settled_flags) == \
+            (n2.metadata.height, n2.metadata.position, n2.metadata.fee, n2.flags), \
+            TxFlags.to_repr(n2.flags)
 
         # Skipped, canary non-cleared.
-        n3 = [ m[1] for m in metadata_entries if m[0] == tx_hash_n3 ][0]
-        assert data_n3.height == n3.metadata.height
-        assert data_n3.position == n3.metadata.position
-        assert data_n3.fee == n3.metadata.fee
-        assert TxFlags.StateDispatched | expected_flags == n3.flags, TxFlags.to_repr(n3.flags)
+        n3 = entries_by_hash[tx_hash_n3]
+        expected_dispatched_flags = TxFlags.StateDispatched | expected_flags
+        assert (data_n3.height, data_n3.position, data_n3.fee, expected_dispatched_flags) == \
+            (n3.metadata.height, n3.metadata.position, n3.metadata.fee, n3.flags), \
+            TxFlags.to_repr(n3.flags)
 
 
-class TestSqliteWriteDispatcher:
-    @classmethod
-    def setup_method(self):
-        self.dispatcher = None
-        self._logger = logs.get_logger("...")
-        class DbConnection:
-            def __enter__(self, *args, **kwargs):
-                pass
-            def __exit__(self, *args, **kwargs):
-                pass
-            def execute(self, query: str) -> None:
-                pass
-        class DbContext:
-            def acquire_connection(self):
-                return DbConnection()
-            def release_connection(self, conn):
-                pass
-        self.db_context = DbContext()
+class _DbConnection:
+    __slots__ = ('batch_count',)
 
-    @classmethod
-    def teardown_method(self):
-        if self.dispatcher is not None:
-            self.dispatcher.stop()
+    def __init__(self) -> None:
+        self.batch_count = 0
+    def execute(self, query: str) -> None:
+        # The dispatcher starts each batch it applies with a 'begin'.
+        if query == 'begin':
+            self.batch_count += 1
+    def commit(self) -> None:
+        pass
+    def rollback(self) -> None:
+        pass
+
+
+class _DbContext:
+    __slots__ = ('_conn',)
+
+    def __init__(self) -> None:
+        self._conn = _DbConnection()
+    def acquire_connection(self):
+        return self._conn
+    def release_connection(self, conn):
+        pass
 
+
+# Every dispatcher test shares the one instance, so tests only compare batch counts they observe.
+_DB_CONTEXT_SINGLETON = _DbContext()
+
+
+class TestSqliteWriteDispatcher:
     # As we use threading pytest can deadlock if something errors. This will break the deadlock
     # and display stacktraces.
-    @pytest.mark.timeout(5)
-    def test_write_dispatcher_to_completion(self) -> None:
-        self.dispatcher = wallet_database.SqliteWriteDispatcher(self.db_context)
-        self.dispatcher._writer_loop_event.wait()
+    pytestmark = pytest.mark.timeout(5)
+
+    @pytest.fixture
+    def dispatcher(self):
+        dispatcher = wallet_database.SqliteWriteDispatcher(_DB_CONTEXT_SINGLETON)
+        assert dispatcher.wait_until_started(5.0)
+        yield dispatcher
+        dispatcher.stop()
 
+    def test_write_dispatcher_to_completion(self, dispatcher) -> None:
         _completion_callback_called = False
         def _completion_callback(success: bool):
             nonlocal _completion_callback_called
@@ -771,26 +841,88 @@ class TestSqliteWriteDispatcher:
             nonlocal _write_callback_called
             _write_callback_called = True
 
-        self.dispatcher.put((_write_callback, _completion_callback))
-        self.dispatcher.stop()
+        # A write that has no completion callback.
+        _write_only_callback_called = False
+        def _write_only_callback(conn):
+            nonlocal _write_only_callback_called
+            _write_only_callback_called = True
+
+        dispatcher.put((_write_callback, _completion_callback))
+        dispatcher.put((_write_only_callback, None))
+        dispatcher.stop()
 
         assert _write_callback_called
         assert _completion_callback_called
+        assert _write_only_callback_called
 
-    # As we use threading pytest can deadlock if something errors. This will break the deadlock
-    # and display stacktraces.
-    @pytest.mark.timeout(5)
-    def test_write_dispatcher_write_only(self) -> None:
-        self.dispatcher = wallet_database.SqliteWriteDispatcher(self.db_context)
-        self.dispatcher._writer_loop_event.wait()
-
-        _write_callback_called = False
+    def test_write_dispatcher_submit(self, dispatcher) -> None:
         def _write_callback(conn):
-            nonlocal _write_callback_called
-            _write_callback_called = True
+            return 5
 
-        self.dispatcher.put((_write_callback, None))
-        self.dispatcher.stop()
+        def _bad_write_callback(conn):
+            raise ValueError("bad write")
 
-        assert _write_callback_called
+        future = dispatcher.submit(_write_callback)
+        bad_future = dispatcher.submit(_bad_write_callback)
 
+        assert future.result(timeout=5) == 5
+        assert isinstance(bad_future.exception(timeout=5), ValueError)
+
+    def test_write_dispatcher_submit_many(self) -> None:
+        db_context = DatabaseContext(DatabaseContext.shared_memory_uri(os.urandom(8).hex()))
+        # We hold onto an open connection to ensure that the database persists for the
+        # lifetime of the test.
+        db = db_context.acquire_connection()
+        try:
+            db.execute("CREATE TABLE Values1000 (value INTEGER)")
+            future = db_context.submit_many(
+                "INSERT INTO Values1000 (value) VALUES (?)", ((i,) for i in range(1000)))
+            assert 1000 == future.result(timeout=5)
+            assert 1000 == db.execute("SELECT COUNT(*) FROM Values1000").fetchone()[0]
+        finally:
+            db_context.release_connection(db)
+            db_context.close()
+
+    def test_write_dispatcher_failed_batch(self, dispatcher) -> None:
+        def _good_write_callback(conn):
+            pass
+
+        def _bad_write_callback(conn):
+            raise ValueError("bad write")
+
+        results = {}
+        def _make_completion_callback(name: str):
+            def _completion_callback(exc_value) -> None:
+                results[name] = exc_value
+            return _completion_callback
+
+        # Whichever batch the failing write lands in gets retried one by one, and only the
+        # failing write should be notified of the error.
+        dispatcher.put((_good_write_callback, _make_completion_callback("good1")))
+        dispatcher.put((_bad_write_callback, _make_completion_callback("bad")))
+        dispatcher.put((_good_write_callback, _make_completion_callback("good2")))
+
+        # Hold the writer inside a write queued after the failed batch, so that the writes
+        # queued after it are all pending when it next gathers a batch.
+        gate_entered = threading.Event()
+        gate = threading.Event()
+        def _gate_write_callback(conn):
+            gate_entered.set()
+            gate.wait(5)
+        dispatcher.put((_gate_write_callback, None))
+        assert gate_entered.wait(5)
+
+        batch_counts = []
+        def _batched_write_callback(conn):
+            batch_counts.append(conn.batch_count)
+        for i in range(3):
+            dispatcher.put((_batched_write_callback, None))
+        gate.set()
+        dispatcher.stop()
+
+        assert results["good1"] is None
+        assert isinstance(results["bad"], ValueError)
+        assert results["good2"] is None
+        # Once the failed batch has been retried one by one, writes are batched again.
+        assert 3 == len(batch_counts)
+        assert 1 == len(set(batch_counts))
@@ -31,6 +31,9 @@ tx_hex_2 = ("010000000113529b6e34ceebfa3911c569b568ef48b95cc25d4c5c6a5b2435d30c9
     "87b1812206fd4efc9ada388acc0dd3e00000000001976a914337106761eb441a326d4027f6d5aa19eed550c298"
     "8ac00000000")
 
+TX_BYTES_1 = bytes.fromhex(tx_hex_1)
+TX_BYTES_2 = bytes.fromhex(tx_hex_2)
+
 
 def _db_context():
     wallet_path = os.path.join(tempfile.mkdtemp(), "wallet_create")
@@ -350,6 +353,23 @@ class TestTransactionTable:
         added_tx_hashes = set(t[0] for t in to_add)
         assert added_tx_hashes == existing_tx_hashes
 
+    @pytest.mark.timeout(8)
+    def test_create_over_multirow_limit(self) -> None:
+        # Larger batches fall back from the multi-row insert to `executemany`.
+        to_add = []
+        for i in range(TransactionTable.CREATE_MULTIROW_LIMIT + 1):
+            tx_bytes = os.urandom(10)
+            tx_hash = bitcoinx.double_sha256(tx_bytes)
+            tx_data = TxData(height=1, fee=2, position=None, date_added=1, date_updated=1)
+            to_add.append((tx_hash, tx_data, tx_bytes, TxFlags.Unset, None))
+        with SynchronousWriter() as writer:
+            self.store.create(to_add, completion_callback=writer.get_callback())
+            assert writer.succeeded()
+
+        existing_tx_hashes = set(self._get_store_hashes())
+        added_tx_hashes = set(t[0] for t in to_add)
+        assert added_tx_hashes == existing_tx_hashes
+
     @pytest.mark.timeout(8)
     def test_update(self):
         to_add = []
@@ -443,8 +463,7 @@ class TestTransactionTable:
     @pytest.mark.timeout(8)
     def test_get_all_pending(self):
         get_tx_hashes = set([])
-        for tx_hex in (tx_hex_1, tx_hex_2):
-            bytedata = bytes.fromhex(tx_hex)
+        for bytedata in (TX_BYTES_1, TX_BYTES_2):
             tx_hash = bitcoinx.double_sha256(bytedata)
             metadata = TxData(height=1, fee=2, position=None, date_added=1, date_updated=1)
             with SynchronousWriter() as writer:
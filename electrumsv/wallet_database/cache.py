@@ -4,6 +4,7 @@ needs to be authoritatively cached above the database. This also reduces the loc
 there will be no reads or
 """
 
+import random
 import threading
 import time
 from typing import Optional, Dict, Set, Iterable, List, Tuple
@@ -18,6 +19,10 @@ from .tables import (byte_repr, CompletionCallbackType, InvalidDataError, Missin
 
 
 class TransactionCacheEntry:
+    # An entry is held for every transaction in the wallet, and is accessed on every cache probe.
+    __slots__ = ("_transaction", "metadata", "bytedata", "_is_bytedata_cached", "flags",
+        "time_loaded")
+
     def __init__(self, metadata: TxData, flags: int, bytedata: Optional[bytes]=None,
             time_loaded: Optional[float]=None, is_bytedata_cached: bool=True) -> None:
         self._transaction = None
@@ -52,12 +57,27 @@ class TransactionCacheEntry:
             f"{byte_repr(self.bytedata)}, {self._is_bytedata_cached})")
 
 
+# The default byte budget for settled transaction bytedata loaded on demand from the store.
+DEFAULT_BYTEDATA_CACHE_SIZE = 16 * 1024 * 1024
+
+
 class TransactionCache:
-    def __init__(self, store: TransactionTable) -> None:
+    def __init__(self, store: TransactionTable,
+            bytedata_cache_size: int=DEFAULT_BYTEDATA_CACHE_SIZE) -> None:
         self._logger = logs.get_logger("cache-tx")
         self._cache: Dict[bytes, TransactionCacheEntry] = {}
         self._store = store
 
+        # Settled transaction bytedata read from the store is only kept up to a byte budget, as
+        # transaction sizes vary too widely for an entry count to bound memory usage. Entries
+        # are evicted at random back to metadata-only, and can be reloaded from the store.
+        self._bytedata_cache_size = bytedata_cache_size
+        self._bytedata_cache_bytes = 0
+        self._bytedata_cache_hashes: List[bytes] = []
+        self._bytedata_cache_entries: Dict[bytes, Tuple[int, int]] = {}
+        # Entries modified in place have their writes counted here until they complete.
+        self._bytedata_pending_writes: Dict[bytes, int] = {}
+
         self._lock = threading.RLock()
 
         self._logger.debug("caching all metadata records")
@@ -71,6 +91,67 @@ class TransactionCache:
     def set_store(self, store: TransactionTable) -> None:
         self._store = store
 
+    def _track_bytedata(self, tx_hash: bytes, entry: TransactionCacheEntry) -> None:
+        # Only bytedata that was read from the store is tracked, as it is known to be safely
+        # reloadable. Written bytedata may not have reached the database yet.
+        if entry.bytedata is None or entry.flags & TxFlags.StateSettled == 0 or \
+                tx_hash in self._bytedata_pending_writes:
+            return
+        self._untrack_bytedata(tx_hash)
+        size = len(entry.bytedata)
+        # The entry being tracked is never the one evicted, as the caller is about to use it.
+        # This means a single entry larger than the budget is kept until something else loads.
+        while self._bytedata_cache_hashes and \
+                self._bytedata_cache_bytes + size > self._bytedata_cache_size:
+            evict_hash = random.choice(self._bytedata_cache_hashes)
+            self._untrack_bytedata(evict_hash)
+            # Callers may hold the existing entry, so it is replaced rather than modified.
+            evict_entry = self._cache[evict_hash]
+            self._cache[evict_hash] = TransactionCacheEntry(evict_entry.metadata,
+                evict_entry.flags, time_loaded=evict_entry.time_loaded,
+                is_bytedata_cached=False)
+
+        self._bytedata_cache_entries[tx_hash] = (len(self._bytedata_cache_hashes), size)
+        self._bytedata_cache_hashes.append(tx_hash)
+        self._bytedata_cache_bytes += size
+
+    def _untrack_bytedata(self, tx_hash: bytes) -> None:
+        if tx_hash not in self._bytedata_cache_entries:
+            return
+        index, size = self._bytedata_cache_entries.pop(tx_hash)
+        # Swap the last tracked hash into the vacated slot to keep removal constant time.
+        last_hash = self._bytedata_cache_hashes.pop()
+        if last_hash != tx_hash:
+            self._bytedata_cache_hashes[index] = last_hash
+            self._bytedata_cache_entries[last_hash] = \
+                (index, self._bytedata_cache_entries[last_hash][1])
+        self._bytedata_cache_bytes -= size
+
+    def _untrack_bytedata_until_written(self,
+            entries: List[Tuple[bytes, TransactionCacheEntry]],
+            completion_callback: Optional[CompletionCallbackType]) -> CompletionCallbackType:
+        # Entries modified in place differ from the store until their write completes, so they
+        # must not be evicted and reloaded before then. The returned completion callback tracks
+        # them again once the write has succeeded.
+        for tx_hash, _entry in entries:
+            self._untrack_bytedata(tx_hash)
+            self._bytedata_pending_writes[tx_hash] = \
+                self._bytedata_pending_writes.get(tx_hash, 0) + 1
+
+        def callback(exc_value: Optional[Exception]) -> None:
+            with self._lock:
+                for tx_hash, entry in entries:
+                    pending_writes = self._bytedata_pending_writes.pop(tx_hash) - 1
+                    if pending_writes:
+                        self._bytedata_pending_writes[tx_hash] = pending_writes
+                    # A failed write leaves the entry differing from the store, and a replaced
+                    # entry is not the one that was written.
+                    elif exc_value is None and self._cache.get(tx_hash) is entry:
+                        self._track_bytedata(tx_hash, entry)
+            if completion_callback is not None:
+                completion_callback(exc_value)
+        return callback
+
     def _validate_transaction_bytes(self, tx_hash: bytes, bytedata: Optional[bytes]) -> bool:
         if bytedata is None:
             return True
@@ -242,8 +323,11 @@ class TransactionCache:
         with self._lock:
             date_updated = self._store._get_current_timestamp()
             entry = self._get_entry(tx_hash)
-            entry.flags = (entry.flags & mask) | (flags & ~TxFlags.METADATA_FIELD_MASK)
-            self._validate_new_flags(entry.flags)
+            new_flags = (entry.flags & mask) | (flags & ~TxFlags.METADATA_FIELD_MASK)
+            self._validate_new_flags(new_flags)
+            completion_callback = self._untrack_bytedata_until_written([ (tx_hash, entry) ],
+                completion_callback)
+            entry.flags = new_flags
             # Update the cached metadata for the new modification date.
             metadata = entry.metadata
             entry.metadata = TxData(metadata.height, metadata.position, metadata.fee,
@@ -257,6 +341,8 @@ class TransactionCache:
         with self._lock:
             date_updated = self._store._get_current_timestamp()
             entry = self._get_entry(tx_hash)
+            completion_callback = self._untrack_bytedata_until_written([ (tx_hash, entry) ],
+                completion_callback)
             metadata = entry.metadata
             entry.metadata = TxData(metadata.height, metadata.position, metadata.fee,
                 metadata.date_added, date_updated)
@@ -268,6 +354,7 @@ class TransactionCache:
         with self._lock:
             self._logger.debug("cache_deletion: %s", hash_to_hex_str(tx_hash))
             del self._cache[tx_hash]
+            self._untrack_bytedata(tx_hash)
 
             self._store.delete([ tx_hash ], completion_callback=completion_callback)
 
@@ -288,6 +375,7 @@ class TransactionCache:
                 if entry.bytedata is not None and new_entry.bytedata is None:
                     self._logger.debug(f"set_cache_entries, bytedata conflict v2 {tx_hash}")
                     raise RuntimeError(f"bytedata conflict 2 for {tx_hash}")
+                self._untrack_bytedata(tx_hash)
         self._cache.update(entries)
 
     # NOTE: Only used by unit tests at this time.
@@ -328,6 +416,7 @@ class TransactionCache:
                 # flushing we can assume that we will not be clobbering any fresh changes.
                 entry = TransactionCacheEntry(metadata, flags_get, bytedata)
                 self.set_cache_entries({ tx_hash: entry })
+                self._track_bytedata(tx_hash, entry)
                 self._logger.debug("get_entry/cache_change: %r", (tx_hash.hex(), entry,
                     TxFlags.to_repr(flags), TxFlags.to_repr(mask)))
                 # If they filter the entry they request, we only give them a matched result.
@@ -438,6 +527,8 @@ class TransactionCache:
             entry = self._cache.get(tx_hash)
             assert entry is not None
             results.append((tx_hash, entry))
+        for tx_hash, entry in cache_additions.items():
+            self._track_bytedata(tx_hash, entry)
 
         if require_all:
             wanted_hashes = set(tx_hashes)
@@ -547,10 +638,12 @@ class TransactionCache:
             # This does not request bytedata so if all metadata is cached, will not hit the
             # database.
             store_updates = []
+            updated_entries = []
             for (tx_hash, metadata) in self.get_metadatas(fetch_flags, fetch_mask):
                 if metadata.height > reorg_height:
                     # Update the cached version to match the changes we are going to apply.
                     entry = self.get_cached_entry(tx_hash)
+                    updated_entries.append((tx_hash, entry))
                     entry.flags = (entry.flags & unverify_mask) | TxFlags.StateCleared
                     # TODO(rt12) BACKLOG the real unconfirmed height may be -1 unconf parent
                     entry.metadata = TxData(height=0, fee=metadata.fee,
@@ -558,6 +651,8 @@ class TransactionCache:
                         date_updated=date_updated)
                     store_updates.append((tx_hash, entry.metadata, entry.flags))
             if len(store_updates):
+                completion_callback = self._untrack_bytedata_until_written(updated_entries,
+                    completion_callback)
                 self._store.update_metadata(store_updates,
                     completion_callback=completion_callback)
             return len(store_updates)
@@ -1,8 +1,10 @@
-import queue
+from collections import deque
+import concurrent.futures
+import logging
 import sqlite3
 import threading
 import traceback
-from typing import Optional, List, Tuple, Callable, Any
+from typing import Any, Callable, Deque, Iterable, List, Optional, Sequence, Tuple, Union
 
 from ..constants import DATABASE_EXT
 from ..logs import logs
@@ -52,9 +54,10 @@ class WriteDisabledError(Exception):
     pass
 
 
-WriteCallbackType = Callable[[sqlite3.Connection], None]
+WriteCallbackType = Callable[[sqlite3.Connection], Any]
 CompletionCallbackType = Callable[[bool], None]
-WriteEntryType = Tuple[WriteCallbackType, Optional[CompletionCallbackType]]
+CompletionType = Union[CompletionCallbackType, concurrent.futures.Future]
+WriteEntryType = Tuple[WriteCallbackType, Optional[CompletionType]]
 
 class SqliteWriteDispatcher:
     """
@@ -63,67 +66,86 @@ class SqliteWriteDispatcher:
     get notified on completion. If an exception happens in the course of a writer, the exception
     is passed back to the invoker in the completion notification.
 
-    Completion notifications are done in a thread so as to not block the write dispatcher.
+    Completion notifications are done in a thread so as to not block the write dispatcher. They
+    are made in the order the writes were applied, but asynchronously to the writer thread.
 
     TODO: Allow writes to be wrapped with async logic so that async coroutines can do writes
     in their natural fashion.
     """
+    # The most write callbacks that will be grouped into the one committed transaction.
+    MAXIMUM_BATCH_SIZE = 64
+
     def __init__(self, db_context: "DatabaseContext") -> None:
         self._db_context = db_context
         self._logger = logs.get_logger(self.__class__.__name__)
 
-        self._writer_queue = queue.Queue()
+        # Appending to and popping from a deque are atomic operations, so the writer thread can
+        # take as many writes as are pending in one go without holding the lock.
+        self._writer_queue: Deque[WriteEntryType] = deque()
+        # Signals both that the writer thread has started and that writes have been queued.
+        self._cv = threading.Condition()
+        self._started = False
         self._writer_thread = threading.Thread(target=self._writer_thread_main, daemon=True)
-        self._writer_loop_event = threading.Event()
-        self._callback_queue = queue.Queue()
-        self._callback_thread = threading.Thread(target=self._callback_thread_main, daemon=True)
-        self._callback_loop_event = threading.Event()
+        # A single worker keeps the completion notifications in order.
+        self._callback_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+            thread_name_prefix="SqliteWriteCompletion")
 
         self._allow_puts = True
         self._is_alive = True
         self._exit_when_empty = False
 
         self._writer_thread.start()
-        self._callback_thread.start()
 
     def _writer_thread_main(self) -> None:
-        self._db = self._db_context.acquire_connection()
-
-        maximum_batch_size = 10
+        # The connection and queue are used for every write, keep them in locals.
+        db = self._db = self._db_context.acquire_connection()
+        writer_queue = self._writer_queue
+        # Any temporary tables and indices the writes need are kept off disk.
+        db.execute("PRAGMA temp_store = MEMORY")
+        with self._cv:
+            self._started = True
+            self._cv.notify_all()
+
+        maximum_batch_size = self.MAXIMUM_BATCH_SIZE
         write_entries: List[WriteEntryType] = []
         write_entry_backlog: List[WriteEntryType] = []
         while self._is_alive:
-            self._writer_loop_event.set()
-
             if len(write_entry_backlog):
                 assert maximum_batch_size == 1
                 write_entries = [ write_entry_backlog.pop(0) ]
             else:
-                # Block until we have at least one write action. If we already have write
-                # actions at this point, it is because we need to retry after a transaction
-                # was rolled back.
-                try:
-                    write_entry: WriteEntryType = self._writer_queue.get(timeout=0.1)
-                except queue.Empty:
-                    if self._exit_when_empty:
+                # Any failed batch has been reapplied one by one, return to batching.
+                maximum_batch_size = self.MAXIMUM_BATCH_SIZE
+                # Block until we have at least one write action or are stopping. A perpetually
+                # blocking wait will not get interrupted by CTRL+C.
+                with self._cv:
+                    if not self._cv.wait_for(
+                            lambda: len(writer_queue) or self._exit_when_empty, 0.1):
+                        continue
+                    if not writer_queue:
+                        # Stopping, and all the queued writes have been applied.
                         return
-                    continue
-                write_entries = [ write_entry ]
+                write_entries = []
 
             # Gather the rest of the batch for this transaction.
-            while len(write_entries) < maximum_batch_size and not self._writer_queue.empty():
-                write_entries.append(self._writer_queue.get_nowait())
+            while len(write_entries) < maximum_batch_size and writer_queue:
+                write_entries.append(writer_queue.popleft())
 
-            # Using the connection as a context manager, apply the batch as a transaction.
-            completion_callbacks: List[Tuple[CompletionCallbackType, bool]] = []
+            # Apply the batch as a transaction.
+            completion_callbacks: List[Tuple[CompletionType, Optional[Exception], Any]] = []
             try:
-                with self._db:
-                    # We have to force a grouped statement transaction with the explicit 'begin'.
-                    self._db.execute('begin')
+                # We have to force a grouped statement transaction with the explicit 'begin'.
+                db.execute('begin')
+                try:
                     for write_callback, completion_callback in write_entries:
-                        write_callback(self._db)
+                        result = write_callback(db)
                         if completion_callback is not None:
-                            completion_callbacks.append((completion_callback, None))
+                            completion_callbacks.append((completion_callback, None, result))
+                    db.commit()
+                except Exception:
+                    # This is a no-op if SQLite has already rolled the transaction back itself.
+                    db.rollback()
+                    raise
                 # The transaction was successfully committed.
             except Exception as e:
                 # Exception: This is caught because we need to relay any exception to the
@@ -139,55 +161,87 @@ class SqliteWriteDispatcher:
                 # We applied the batch actions one by one. If there was an error with this action
                 # then we've logged it, so we can discard it for lack of any other option.
                 if write_entries[0][1] is not None:
-                    completion_callbacks.append((write_entries[0][1], e))
+                    completion_callbacks.append((write_entries[0][1], e, None))
             else:
-                if len(write_entries) > 1:
+                if len(write_entries) > 1 and self._logger.isEnabledFor(logging.DEBUG):
                     self._logger.debug("Invoked %d write callbacks", len(write_entries))
 
             for completion_callback in completion_callbacks:
-                self._callback_queue.put_nowait(completion_callback)
-
-    def _callback_thread_main(self) -> None:
-        while self._is_alive:
-            self._callback_loop_event.set()
-
-            # A perpetually blocking get will not get interrupted by CTRL+C.
-            try:
-                callback, exc_value = self._callback_queue.get(timeout=0.2)
-            except queue.Empty:
-                if self._exit_when_empty:
-                    return
-                continue
-
-            try:
+                try:
+                    self._callback_executor.submit(self._invoke_completion, *completion_callback)
+                except RuntimeError:
+                    # The executor refuses work once interpreter shutdown has started, and this
+                    # daemon thread may still be committing a batch then.
+                    self._invoke_completion(*completion_callback)
+
+    def _invoke_completion(self, callback: CompletionType, exc_value: Optional[Exception],
+            result: Any) -> None:
+        try:
+            if isinstance(callback, concurrent.futures.Future):
+                if exc_value is None:
+                    callback.set_result(result)
+                else:
+                    callback.set_exception(exc_value)
+            else:
                 callback(exc_value)
-            except Exception as e:
-                traceback.print_exc()
-                self._logger.exception("Exception within completion callback", exc_info=e)
+        except Exception as e:
+            traceback.print_exc()
+            self._logger.exception("Exception within completion callback", exc_info=e)
 
     def put(self, write_entry: WriteEntryType) -> None:
         # If the writer is closed, then it is expected the caller should have made sure that
         # no more puts will be made, and the error will only be raised if something puts to
         # flag that it is wrong.
-        if not self._allow_puts:
-            raise WriteDisabledError()
-
-        self._writer_queue.put_nowait(write_entry)
+        # The writer only waits when it finds the queue empty, so only the put that makes it
+        # non-empty needs to wake it. Others are picked up as part of the drain in progress.
+        with self._cv:
+            if not self._allow_puts:
+                raise WriteDisabledError()
+            self._writer_queue.append(write_entry)
+            if len(self._writer_queue) == 1:
+                self._cv.notify()
+
+    def submit(self, write_callback: WriteCallbackType) -> concurrent.futures.Future:
+        """
+        Queue a write and get a future for it. The future gets the return value of the write
+        callback once the transaction it was applied in is committed, or the exception it raised.
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        # Once queued the write cannot be withdrawn, so the future cannot be cancelled.
+        future.set_running_or_notify_cancel()
+        self.put((write_callback, future))
+        return future
+
+    def submit_many(self, sql: str, params_iter: Iterable[Sequence[Any]]) -> \
+            concurrent.futures.Future:
+        """
+        Queue one statement to be executed for each of the given parameter rows. The statement
+        is prepared once for all of them. The future gets the number of rows modified.
+        """
+        params = list(params_iter)
+        def _write(db: sqlite3.Connection) -> int:
+            return db.executemany(sql, params).rowcount
+        return self.submit(_write)
+
+    def wait_until_started(self, timeout: Optional[float]=None) -> bool:
+        with self._cv:
+            return self._cv.wait_for(lambda: self._started, timeout)
 
     def stop(self) -> None:
         if self._exit_when_empty:
             return
 
-        self._allow_puts = False
-        self._exit_when_empty = True
+        # The writer applies whatever is still queued, and exits when it finds the queue empty.
+        with self._cv:
+            self._allow_puts = False
+            self._exit_when_empty = True
+            self._cv.notify_all()
 
-        # Wait for both threads to exit.
-        self._writer_loop_event.wait()
+        # Wait for the writer to exit, then for the completion notifications it made.
         self._writer_thread.join()
         self._db_context.release_connection(self._db)
         self._db = None
-        self._callback_loop_event.wait()
-        self._callback_thread.join()
+        self._callback_executor.shutdown(wait=True)
 
         self._is_alive = False
 
@@ -197,6 +251,9 @@ class SqliteWriteDispatcher:
 
 class DatabaseContext:
     MEMORY_PATH = ":memory:"
+    # The sqlite3 module keeps this many prepared statements per connection, keyed on the SQL
+    # text. The batched `IN (?, ...)` reads generate a range of different statements.
+    CACHED_STATEMENTS = 256
 
     def __init__(self, wallet_path: str) -> None:
         if not self.is_special_path(wallet_path) and not wallet_path.endswith(DATABASE_EXT):
@@ -210,7 +267,7 @@ class DatabaseContext:
     def acquire_connection(self) -> sqlite3.Connection:
         debug_text = traceback.format_stack()
         connection = sqlite3.connect(self._db_path, check_same_thread=False,
-            isolation_level=None)
+            isolation_level=None, cached_statements=self.CACHED_STATEMENTS)
         connection.execute("PRAGMA foreign_keys = ON")
         # self._debug_texts[connection] = debug_text
         self._connections.append(connection)
@@ -228,6 +285,10 @@ class DatabaseContext:
             completion_callback: Optional[CompletionCallbackType]=None) -> None:
         self._write_dispatcher.put((write_callback, completion_callback))
 
+    def submit_many(self, sql: str, params_iter: Iterable[Sequence[Any]]) -> \
+            concurrent.futures.Future:
+        return self._write_dispatcher.submit_many(sql, params_iter)
+
     def close(self) -> None:
         self._write_dispatcher.stop()
         # for connection in self._connections:
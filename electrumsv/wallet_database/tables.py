@@ -1,5 +1,6 @@
 from collections import namedtuple
 from io import BytesIO
+import itertools
 import json
 import sqlite3
 import time
@@ -235,9 +236,13 @@ class TransactionRow(NamedTuple):
 class TransactionTable(BaseWalletStore):
     LOGGER_NAME = "db-table-tx"
 
-    CREATE_SQL = ("INSERT INTO Transactions (tx_hash, tx_data, flags, "
+    CREATE_BASE_SQL = ("INSERT INTO Transactions (tx_hash, tx_data, flags, "
         "block_height, block_position, fee_value, description, date_created, date_updated) "
-        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+        "VALUES ")
+    CREATE_VALUES_SQL = "(?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    CREATE_SQL = CREATE_BASE_SQL + CREATE_VALUES_SQL
+    # Small batches are inserted with one multi-row statement rather than `executemany`.
+    CREATE_MULTIROW_LIMIT = min(50, SQLITE_MAX_VARS // 9)
     READ_BASE_SQL = ("SELECT tx_data, flags, block_height, block_position, fee_value, "
         "date_created, date_updated FROM Transactions WHERE tx_hash=?")
     READ_DESCRIPTION_SQL = ("SELECT tx_hash, description FROM Transactions "
@@ -353,20 +358,25 @@ class TransactionTable(BaseWalletStore):
                 self._logger.debug("add %d transactions", len(entries))
             else:
                 self._logger.debug("add %d transactions (too many to show)", len(entries))
-            db.executemany(self.CREATE_SQL, datas)
+            if 0 < len(datas) <= self.CREATE_MULTIROW_LIMIT:
+                query = self.CREATE_BASE_SQL +",".join([ self.CREATE_VALUES_SQL ] * len(datas))
+                db.execute(query, list(itertools.chain.from_iterable(datas)))
+            else:
+                db.executemany(self.CREATE_SQL, datas)
         self._db_context.queue_write(_write, completion_callback)
 
     def read(self, flags: Optional[int]=None, mask: Optional[int]=None,
             tx_hashes: Optional[Iterable[bytes]]=None) -> List[Tuple[Optional[bytes],
                 int, int, TxData]]:
         query = self.READ_MANY_BASE_SQL
-        return [ (row[0], row[1], row[2], TxData(row[3], row[4], row[5], row[6], row[7]))
+        # The trailing columns are in `TxData` field order and can be used to build it directly.
+        return [ (row[0], row[1], row[2], TxData._make(row[3:]))
             for row in self._get_many_common(query, flags, mask, tx_hashes) ]
 
     def read_metadata(self, flags: Optional[int]=None, mask: Optional[int]=None,
             tx_hashes: Optional[Iterable[bytes]]=None) -> List[Tuple[bytes, int, TxData]]:
         query = self.READ_METADATA_MANY_BASE_SQL
-        return [ (row[0], row[1], TxData(row[2], row[3], row[4], row[5], row[6]))
+        return [ (row[0], row[1], TxData._make(row[2:]))
             for row in self._get_many_common(query, flags, mask, tx_hashes) ]
 
     def read_descriptions(self,